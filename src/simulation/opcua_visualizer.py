@@ -27,6 +27,7 @@ class OPCUAVisualizer:
         self.viz = WastewaterVisualizer()
         self.running = True
         self.nsidx = None
+        self._last_timestamp = None  # Timestamp of the state last drawn
 
         # Node references
         self.nodes = {}
@@ -132,11 +133,17 @@ class OPCUAVisualizer:
                 # Read state from OPC UA
                 state = await self.read_state()
 
-                # Update visualization
-                self.viz.update(state)
+                # The server steps far less often than we poll; only a new
+                # timestep is added to the history and redrawn
+                if state.timestamp != self._last_timestamp:
+                    self._last_timestamp = state.timestamp
+
+                    # Update visualization
+                    self.viz.update(state)
+
+                    # Redraw (blits dynamic artists only)
+                    self.viz.redraw()
 
-                # Redraw
-                self.viz.fig.canvas.draw_idle()
                 self.viz.fig.canvas.flush_events()
 
                 # Wait a bit
@@ -3,8 +3,6 @@ Pump Models for HSY Wastewater Station
 Based on Grundfos pump curves from PDF data
 """
 
-import numpy as np
-from typing import Dict, Tuple
 from dataclasses import dataclass
 
 
@@ -65,16 +63,10 @@ class PumpModel:
     }
 
     # Pump type assignments (for fallback if needed)
-    PUMP_TYPES = {
-        '1.1': 'small',
-        '1.2': 'large',
-        '1.3': 'large',
-        '1.4': 'large',
-        '2.1': 'small',
-        '2.2': 'large',
-        '2.3': 'large',
-        '2.4': 'large'
-    }
+    PUMP_TYPES = {pid: pump_type for pid, (_, pump_type) in PUMP_CALIBRATION.items()}
+
+    # Small pumps as a set for O(1) classification; any other ID is large
+    SMALL_PUMPS = frozenset(pid for pid, pump_type in PUMP_TYPES.items() if pump_type == 'small')
 
     def __init__(self):
         """Initialize pump model"""
@@ -82,15 +74,12 @@ class PumpModel:
 
     def get_pump_specs(self, pump_id: str) -> PumpSpecs:
         """Get specifications for a specific pump"""
+        base_specs = self.SMALL_PUMP_SPECS if pump_id in self.SMALL_PUMPS else self.LARGE_PUMP_SPECS
+
         # Check if we have individual calibration for this pump
         if pump_id in self.PUMP_CALIBRATION:
-            p_rated, pump_type = self.PUMP_CALIBRATION[pump_id]
-            # Create customized specs with individual calibration
-            if pump_type == 'large':
-                base_specs = self.LARGE_PUMP_SPECS
-            else:
-                base_specs = self.SMALL_PUMP_SPECS
-            
+            p_rated = self.PUMP_CALIBRATION[pump_id][0]
+
             # Return new specs with calibrated power
             return PumpSpecs(
                 name=f"Pump {pump_id}",
@@ -102,13 +91,9 @@ class PumpModel:
                 nominal_speed_rpm=base_specs.nominal_speed_rpm,
                 nominal_frequency_hz=base_specs.nominal_frequency_hz
             )
-        
-        # Fallback to type-based lookup
-        pump_type = self.PUMP_TYPES.get(pump_id, 'large')
-        if pump_type == 'large':
-            return self.LARGE_PUMP_SPECS
-        else:
-            return self.SMALL_PUMP_SPECS
+
+        # Fallback to type-based specs
+        return base_specs
 
     def calculate_head(self, L1: float) -> float:
         """
@@ -128,7 +113,7 @@ class PumpModel:
         pump_id: str,
         frequency_hz: float,
         L1: float
-    ) -> Tuple[float, float, float]:
+    ) -> tuple[float, float, float]:
         """
         Calculate pump flow, power, and efficiency using affinity laws
 
@@ -159,7 +144,8 @@ class PumpModel:
         # Power scales with cube of speed
         # Note: In reality, power also depends on head, but for variable frequency
         # drives operating near design point, this is a good approximation
-        power_kw = specs.rated_power_kw * (speed_ratio ** 3)
+        sr = speed_ratio
+        power_kw = specs.rated_power_kw * (sr * sr * sr)
 
         # Efficiency calculation
         # Efficiency is relatively constant near design point (±3% speed variation)
@@ -173,7 +159,7 @@ class PumpModel:
         efficiency = specs.rated_efficiency * efficiency_penalty
 
         # Clamp efficiency to reasonable range
-        efficiency = max(0.7, min(0.9, efficiency))
+        efficiency = 0.7 if efficiency < 0.7 else 0.9 if efficiency > 0.9 else efficiency
 
         return flow_m3h, power_kw, efficiency
 
@@ -269,6 +255,17 @@ class PumpController:
         runtime = self.get_runtime_hours(pump_id)
         return runtime >= min_hours
 
+    def check_minimum_runtime_all(self, min_hours: float = 2.0) -> dict:
+        """Check minimum runtime for every pump in a single pass"""
+        # Compare start times against one cutoff instead of computing each runtime
+        if self.current_time is None:
+            return {pid: False for pid in self.pump_states}
+
+        cutoff = self.current_time - min_hours * 3600.0
+        return {pid: state['running'] and state['start_time'] is not None
+                and state['start_time'] <= cutoff
+                for pid, state in self.pump_states.items()}
+
 
 if __name__ == "__main__":
     # Test pump models
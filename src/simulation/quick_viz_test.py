@@ -31,9 +31,11 @@ def main():
     # Run for a few timesteps and save snapshots
     timesteps_to_save = [0, 10, 50, 100, 150, 200]
 
+    state = simulator.get_state()
+
     for step in range(201):
-        # Simple control strategy
-        L1 = simulator.get_state().L1
+        # Simple control strategy (based on the state returned by the last step)
+        L1 = state.L1
 
         if L1 > 6.0:
             commands = [
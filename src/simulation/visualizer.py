@@ -5,26 +5,97 @@ Shows cross-section view, pump status, and system metrics
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-from matplotlib.animation import FuncAnimation
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.colors import to_rgba
 import numpy as np
+import queue
+import threading
+import traceback
+from bisect import bisect_left
 from datetime import datetime
 from typing import Optional
-import sys
-from pathlib import Path
-
-# Add parent to path for imports
-sys.path.insert(0, str(Path(__file__).parent))
 
+# Sibling modules resolve from this directory: it is sys.path[0] when run as a
+# script, and the other entry points (quick_viz_test, opcua_visualizer) add it
 from data_loader import HSYDataLoader
 from physics_simulator import TunnelSimulator, PumpCommand, SystemState
 
 
+PUMP_IDS = ('1.1', '1.2', '1.3', '1.4', '2.1', '2.2', '2.3', '2.4')
+# One bit per pump (bit i is PUMP_IDS[i]), so a set of running pumps is one int
+PUMP_BITS = {pump_id: 1 << i for i, pump_id in enumerate(PUMP_IDS)}
+PUMP_SHIFTS = np.arange(len(PUMP_IDS))
+
+# Outflow F2 (m³/h) to m³/15min, so it plots on the same scale as inflow F1
+F2_SCALE = 0.25
+
+# Water colors by alarm band: normal (dodger blue), alarm (tomato red), critical (dark red)
+WATER_COLORS = tuple(to_rgba(color) for color in ('#1E90FF', '#FF6347', '#8B0000'))
+
+# Pump body colors (face, edge) - green if running, gray if off
+PUMP_ON_COLORS = (to_rgba('#00FF00', 0.9), to_rgba('black', 0.9))
+PUMP_OFF_COLORS = (to_rgba('gray', 0.5), to_rgba('black', 0.5))
+
+# Level-band control strategy: pumps to run (pump_id -> frequency) per band,
+# lowest band first. A band applies while L1 is above its lower threshold.
+CONTROL_THRESHOLDS = (1.0, 3.0, 6.0)
+CONTROL_BANDS = (
+    {'2.1': 47.5},                                          # Very low - 1 pump minimum
+    {'2.2': 48.0, '2.3': 48.0},                             # Low - 2 pumps, lower frequency
+    {'2.2': 49.0, '2.3': 49.0},                             # Medium - 2 pumps
+    {'1.2': 50.0, '1.4': 50.0, '2.2': 50.0, '2.3': 50.0},   # High - 4 pumps
+)
+
+# ON/OFF PumpCommand for every pump in each band, built once. The simulator
+# only reads commands, so the same instances are handed out every step
+CONTROL_COMMANDS = tuple(
+    tuple(PumpCommand(pump_id, start=pump_id in band, frequency=band.get(pump_id, 50.0))
+          for pump_id in PUMP_IDS)
+    for band in CONTROL_BANDS
+)
+
+
+def decimate_minmax(window: np.ndarray, buckets: int) -> np.ndarray:
+    """
+    Min/max decimation of a (step, series...) history window for display
+
+    Samples are split into equal buckets and each bucket becomes two points,
+    its minimum and maximum, placed at the bucket's first and last step so
+    the decimated line spans the same steps. Peaks and dips are preserved,
+    unlike plain striding.
+
+    Args:
+        window: Array with the step row first and one row per series
+        buckets: Number of buckets (must be smaller than the window length)
+
+    Returns:
+        Array of shape (rows, 2 * buckets)
+    """
+
+    starts = np.linspace(0, window.shape[1], buckets, endpoint=False).astype(np.intp)
+    ends = np.append(starts[1:], window.shape[1]) - 1
+
+    out = np.empty((window.shape[0], 2 * buckets))
+    out[0, 0::2] = window[0, starts]
+    out[0, 1::2] = window[0, ends]
+    out[1:, 0::2] = np.minimum.reduceat(window[1:], starts, axis=1)
+    out[1:, 1::2] = np.maximum.reduceat(window[1:], starts, axis=1)
+    return out
+
+
 class WastewaterVisualizer:
     """
     Real-time 2D visualization of the wastewater pumping system
     Shows cross-sectional view with tunnel, pumps, and water level
     """
 
+    XLIM_STEP = 50  # Time window of the metric panels moves in steps of this size
+    WATER_LEVEL_EPS = 0.01  # Water level change (m) needed to move the water artists
+    YLIM_MIN_GROWTH = 1.25  # A y-limit grows by at least this factor, and shrinks only below its square
+    LEGEND_BELOW = dict(loc='upper center', bbox_to_anchor=(0.5, -0.2), ncol=2,
+                        frameon=False, fontsize=8)  # Metric legends, under the x label
+    DISPLAY_BUCKETS = 400  # Longer history windows are min/max decimated to this many buckets
+
     def __init__(self, figsize=(16, 10)):
         """Initialize visualizer"""
 
@@ -54,16 +125,30 @@ class WastewaterVisualizer:
 
         # Data storage for time series
         # INCREASED history_size to 1500 to show full dataset
-        self.history_size = 1500 
-        self.time_history = []
-        self.L1_history = []
-        self.F1_history = []
-        self.F2_history = []
-        self.cost_history = []
-        self.price_history = []
+        self.history_size = 1500
+
+        # One row per series (step, L1, F1, F2, cost, price). The buffer holds
+        # two windows so the latest history_size samples are always a contiguous
+        # slice; it is only shifted back once it fills up
+        self._history = np.empty((6, 2 * self.history_size))
+        self._history_end = 0  # One past the newest sample
+        self._step = 0  # Number of updates so far
+
+        # Maximum of each value series (L1, F1, F2, cost, price) over the window
+        self._history_max = np.full(5, -np.inf)
 
         # Current state
         self.current_state = None
+        self._shown_text = {}  # Text artist -> string it currently shows
+        self._last_timestamp = None  # Timestamp shown in time_text
+
+        # Blitting state (see redraw)
+        self._background = None
+        self.layout_dirty = True  # axis limits changed since last full draw
+
+        # Current axis limits of the metric panels (see _update_xlim/_fit_ylim)
+        self._xlim = None
+        self._ylim_top = {}
 
         # Initialize plots
         self._setup_cross_section()
@@ -77,7 +162,13 @@ class WastewaterVisualizer:
         ax = self.ax_cross
         ax.set_xlim(-10, 120)
         ax.set_ylim(-5, 40)
-        ax.set_aspect('equal')
+        ax.set_aspect('equal', adjustable='box', anchor='C')
+
+        # The scene never changes extent: skip autoscaling and tick locating
+        ax.set_autoscale_on(False)
+        ax.use_sticky_edges = False
+        ax.set_xticks(np.arange(0, 121, 20))
+        ax.set_yticks(np.arange(-5, 41, 5))
         ax.set_xlabel('Distance (m)', fontsize=10)
         ax.set_ylabel('Elevation (m)', fontsize=10)
         ax.set_title('System Cross-Section', fontsize=12, fontweight='bold')
@@ -113,17 +204,23 @@ class WastewaterVisualizer:
         # Water (will be updated)
         self.water_patch = patches.Rectangle((0.5, self.tunnel_ground + 0.5),
                                             self.tunnel_length - 1, 0,
-                                            linewidth=0, facecolor='#1E90FF',
+                                            linewidth=0, facecolor=WATER_COLORS[0],
                                             alpha=0.7, label='Water')
         ax.add_patch(self.water_patch)
+        self._water_band = 0  # Index into WATER_COLORS
 
         # Water level line (will be updated)
         self.water_line, = ax.plot([0, self.tunnel_length], [0, 0],
                                    'b-', linewidth=2, label='Water Level')
-
-        # Level markers
-        for level in [0, 2, 4, 6, 7.2, 8, 10, 12, 14]:
-            ax.axhline(y=level, color='gray', linestyle='--', alpha=0.3, linewidth=0.5)
+        self._water_L1 = None  # Level the water patch and line currently show
+
+        # Level markers (one collection spanning the axes, like axhline)
+        levels = [0, 2, 4, 6, 7.2, 8, 10, 12, 14]
+        x_left, x_right = ax.get_xlim()
+        ax.add_collection(LineCollection([[(x_left, y), (x_right, y)] for y in levels],
+                                         colors='gray', linestyles='--',
+                                         alpha=0.3, linewidths=0.5))
+        for level in levels:
             ax.text(-2, level, f'{level}m', fontsize=8, va='center')
 
         # Alarm level marker
@@ -147,34 +244,43 @@ class WastewaterVisualizer:
                fontsize=10, ha='center', va='center', fontweight='bold')
 
         # Draw pumps (along the right side of tunnel)
-        self.pump_patches = {}
+        self.pump_labels = {}
+        pump_rects = []
+        pipe_segments = []
         pump_x = self.tunnel_length + 2
         pump_y_start = 5
         pump_spacing = 3
 
-        pump_ids = ['1.1', '1.2', '1.3', '1.4', '2.1', '2.2', '2.3', '2.4']
-
-        for i, pump_id in enumerate(pump_ids):
+        for i, pump_id in enumerate(PUMP_IDS):
             y_pos = pump_y_start + i * pump_spacing
 
             # Pump body (rectangle)
-            pump_rect = patches.Rectangle((pump_x, y_pos), 3, 2,
-                                         linewidth=2, edgecolor='black',
-                                         facecolor='gray',
-                                         alpha=0.5)
-            ax.add_patch(pump_rect)
+            pump_rects.append(patches.Rectangle((pump_x, y_pos), 3, 2))
 
             # Pump label
-            ax.text(pump_x + 1.5, y_pos + 1, f'P{pump_id}',
-                   fontsize=8, ha='center', va='center',
-                   fontweight='bold')
+            pump_label = ax.text(pump_x + 1.5, y_pos + 1, f'P{pump_id}',
+                                fontsize=8, ha='center', va='center',
+                                fontweight='bold')
 
             # Store reference
-            self.pump_patches[pump_id] = pump_rect
+            self.pump_labels[pump_id] = pump_label
+
+            # Pipe to WWTP (thin line, drawn below as one collection)
+            pipe_segments.append([(pump_x + 3, y_pos + 1), (wwtp_x, self.wwtp_level)])
+
+        # Pipes share one style, so a single collection draws all of them
+        ax.add_collection(LineCollection(pipe_segments, colors='k', linewidths=1,
+                                         alpha=0.3, capstyle='projecting', zorder=2))
 
-            # Draw pipe to WWTP (thin line)
-            ax.plot([pump_x + 3, wwtp_x], [y_pos + 1, self.wwtp_level],
-                   'k-', linewidth=1, alpha=0.3)
+        # All pump bodies in one collection, colored per pump in update()
+        # (which recolors it only when the running mask changes)
+        self._pump_mask = 0  # Bitmask of running pumps (see PUMP_BITS)
+        self._pump_facecolors = np.tile(PUMP_OFF_COLORS[0], (len(PUMP_IDS), 1))
+        self._pump_edgecolors = np.tile(PUMP_OFF_COLORS[1], (len(PUMP_IDS), 1))
+        self.pump_collection = PatchCollection(pump_rects, linewidths=2,
+                                               facecolors=self._pump_facecolors,
+                                               edgecolors=self._pump_edgecolors)
+        ax.add_collection(self.pump_collection)
 
         # Inflow arrow (we need to be able to update this artist)
         self.inflow_arrow = ax.arrow(0, self.tunnel_height + 2, 5, -3,
@@ -195,6 +301,10 @@ class WastewaterVisualizer:
                                    fontsize=10, ha='center',
                                    bbox=dict(boxstyle='round', facecolor='lightgreen', alpha=0.8))
 
+        # Simulation timestamp (an axes artist so it can be blitted, unlike suptitle)
+        self.time_text = ax.text(0.01, 0.97, '', transform=ax.transAxes,
+                                fontsize=11, ha='left', va='top', fontweight='bold')
+
     def _setup_metrics(self):
         """Setup metric panels"""
 
@@ -206,7 +316,10 @@ class WastewaterVisualizer:
         self.ax_level.axhline(y=7.2, color='red', linestyle='--', alpha=0.5, label='Alarm')
         self.ax_level.axhline(y=8.0, color='darkred', linestyle='-', alpha=0.7, label='Max')
         self.level_line, = self.ax_level.plot([], [], 'b-', linewidth=2)
-        self.ax_level.legend(fontsize=8)
+        # Legends sit in a row under each panel, where no data can reach them;
+        # they are then part of the static background instead of being
+        # placed (loc='best') and redrawn on every blit
+        self.ax_level.legend(**self.LEGEND_BELOW)
 
         # Flow history
         self.ax_flow.set_title('Flow Rates', fontsize=10, fontweight='bold')
@@ -215,7 +328,7 @@ class WastewaterVisualizer:
         self.ax_flow.grid(True, alpha=0.3)
         self.F1_line, = self.ax_flow.plot([], [], 'b-', linewidth=2, label='Inflow F1')
         self.F2_line, = self.ax_flow.plot([], [], 'g-', linewidth=2, label='Outflow F2')
-        self.ax_flow.legend(fontsize=8)
+        self.ax_flow.legend(**self.LEGEND_BELOW)
 
         # Cost and price
         self.ax_cost.set_title('Energy Cost & Price', fontsize=10, fontweight='bold')
@@ -231,7 +344,23 @@ class WastewaterVisualizer:
         # Combine legends
         lines1, labels1 = self.ax_cost.get_legend_handles_labels()
         lines2, labels2 = self.ax_cost_twin.get_legend_handles_labels()
-        self.ax_cost.legend(lines1 + lines2, labels1 + labels2, fontsize=8)
+        self.ax_cost.legend(lines1 + lines2, labels1 + labels2, **self.LEGEND_BELOW)
+
+        # Bound set_data of each history line, in the order update() feeds them
+        self._line_setters = (self.level_line.set_data, self.F1_line.set_data,
+                              self.F2_line.set_data, self.cost_line.set_data,
+                              self.price_line.set_data)
+
+        # Limits are set explicitly in update (_update_xlim/_fit_ylim), so
+        # never let matplotlib recompute data limits from the artists
+        for ax in (self.ax_level, self.ax_flow, self.ax_cost, self.ax_cost_twin):
+            ax.set_autoscale_on(False)
+            ax.use_sticky_edges = False
+
+        # Start from the first time window and the fixed level range (alarm
+        # and max lines in view), so the first frames need no rescale
+        self._update_xlim(0, 0)
+        self._fit_ylim(self.ax_level, 0.0, 1.05, minimum=8.5)
 
     def update(self, state: SystemState):
         """Update visualization with new state"""
@@ -244,111 +373,215 @@ class WastewaterVisualizer:
         L1 = state.L1
         water_height = max(0, L1 - self.tunnel_ground)
 
-        self.water_patch.set_height(water_height)
-        self.water_line.set_ydata([L1, L1])
+        # A centimetre is far below one pixel at this scale, so smaller level
+        # changes leave the water artists untouched
+        if self._water_L1 is None or abs(L1 - self._water_L1) > self.WATER_LEVEL_EPS:
+            self.water_patch.set_height(water_height)
+            self.water_line.set_ydata([L1, L1])
+            self._water_L1 = L1
 
-        # Update water color based on alarm status
-        if L1 > 8.0:
-            self.water_patch.set_facecolor('#8B0000')  # Dark red (Critical)
-        elif L1 > 7.2:
-            self.water_patch.set_facecolor('#FF6347')  # Tomato red (Alarm)
-        else:
-            self.water_patch.set_facecolor('#1E90FF')  # Dodger blue (Normal)
+        # Update water color based on alarm status (only on band changes)
+        water_band = 2 if L1 > 8.0 else 1 if L1 > 7.2 else 0
+        if water_band != self._water_band:
+            self.water_patch.set_facecolor(WATER_COLORS[water_band])
+            self._water_band = water_band
 
         # Update pump colors based on status (Fix: Ensure correct state access)
-        # Pump IDs are the keys in self.pump_patches, and they should match state.active_pumps
-        for pump_id, pump_patch in self.pump_patches.items():
-            if pump_id in state.active_pumps:
-                # Green if running
-                pump_patch.set_facecolor('#00FF00')
-                pump_patch.set_alpha(0.9)
-            else:
-                # Gray if off
-                pump_patch.set_facecolor('gray')
-                pump_patch.set_alpha(0.5)
-
-        # Update text annotations
-        self.level_text.set_text(f'L1 = {L1:.2f} m\nV = {state.V:.0f} m³')
-        self.inflow_text.set_text(f'Inflow\n{state.F1:.0f} m³/15min')
-        self.outflow_text.set_text(f'Outflow\n{state.F2:.0f} m³/h')
+        # Only the (at most four) active pumps are visited; unknown IDs are ignored
+        mask = 0
+        for pump_id in state.active_pumps:
+            mask |= PUMP_BITS.get(pump_id, 0)
+
+        # Recolor the collection only when some pump switched on or off
+        if mask != self._pump_mask:
+            self._pump_mask = mask
+            running = ((mask >> PUMP_SHIFTS) & 1).astype(bool)
+            self._pump_facecolors[running] = PUMP_ON_COLORS[0]
+            self._pump_facecolors[~running] = PUMP_OFF_COLORS[0]
+            self._pump_edgecolors[running] = PUMP_ON_COLORS[1]
+            self._pump_edgecolors[~running] = PUMP_OFF_COLORS[1]
+            self.pump_collection.set_facecolor(self._pump_facecolors)
+            self.pump_collection.set_edgecolor(self._pump_edgecolors)
+
+        # Update text annotations (values are rounded for display, so
+        # consecutive frames often format to the same string)
+        self._set_text(self.level_text, f'L1 = {L1:.2f} m\nV = {state.V:.0f} m³')
+        self._set_text(self.inflow_text, f'Inflow\n{state.F1:.0f} m³/15min')
+        self._set_text(self.outflow_text, f'Outflow\n{state.F2:.0f} m³/h')
 
         # --- History Update ---
 
-        current_step = len(self.time_history)
-        self.time_history.append(current_step)
-        self.L1_history.append(L1)
-        self.F1_history.append(state.F1)
-        self.F2_history.append(state.F2 / 4)  # Convert to m³/15min for comparison
-        self.cost_history.append(state.total_energy_cost)
-        self.price_history.append(state.electricity_price)
-
-        # Keep history size fixed (important for visualization performance/window)
-        if len(self.time_history) > self.history_size:
-            self.time_history.pop(0)
-            self.L1_history.pop(0)
-            self.F1_history.pop(0)
-            self.F2_history.pop(0)
-            self.cost_history.pop(0)
-            self.price_history.pop(0)
-        
-        # Recalculate time history for x-axis if history was trimmed
-        # This ensures the plot always starts at 0 steps relative to the window
-        if len(self.time_history) == self.history_size and self.history_size > 0:
-            start_step = current_step - self.history_size + 1
-            x_data = np.arange(start_step, current_step + 1)
+        current_step = self._step
+        self._step += 1
+
+        # The oldest sample drops out of a full window; if it held a series
+        # maximum, that maximum has to be rescanned below so the y-limits can
+        # shrink once a peak has left the window (see _fit_ylim)
+        if self._history_end >= self.history_size:
+            evicted = self._history[1:, self._history_end - self.history_size]
+            rescan = evicted >= self._history_max
         else:
-            x_data = np.array(self.time_history)
+            rescan = None
+
+        # Buffer full: move the latest window (minus the slot about to be
+        # written) back to the front
+        if self._history_end == self._history.shape[1]:
+            keep = self.history_size - 1
+            self._history[:, :keep] = self._history[:, self._history_end - keep:self._history_end]
+            self._history_end = keep
+
+        sample = self._history[:, self._history_end]
+        sample[:] = (
+            current_step,
+            L1,
+            state.F1,
+            state.F2 * F2_SCALE,  # Convert to m³/15min for comparison
+            state.total_energy_cost,
+            state.electricity_price,
+        )
+        self._history_end += 1
 
+        # Latest window as views into the buffer (no copying)
+        start = max(0, self._history_end - self.history_size)
+        window = self._history[:, start:self._history_end]
+        x_data, L1_hist, F1_hist, F2_hist, cost_hist, price_hist = window
+
+        # Window maxima: O(1) per update except when a maximum is evicted
+        np.maximum(self._history_max, sample[1:], out=self._history_max)
+        if rescan is not None and rescan.any():
+            self._history_max[rescan] = window[1:][rescan].max(axis=1)
+        L1_max, F1_max, F2_max, cost_max, price_max = self._history_max
+
+        # The panels are only a few hundred pixels wide; drawing every sample
+        # of a long window adds vertices without changing the picture
+        if window.shape[1] > 2 * self.DISPLAY_BUCKETS:
+            x_data, L1_hist, F1_hist, F2_hist, cost_hist, price_hist = \
+                decimate_minmax(window, self.DISPLAY_BUCKETS)
 
         # --- Time Series Plot Update (Key Fixes for Axes) ---
 
-        self.level_line.set_data(x_data, self.L1_history)
-        self.F1_line.set_data(x_data, self.F1_history)
-        self.F2_line.set_data(x_data, self.F2_history)
-        self.cost_line.set_data(x_data, self.cost_history)
-        self.price_line.set_data(x_data, self.price_history)
-
-        # Auto-scale axes - *Crucial fix for graph failure*
-        if len(x_data) > 1:
-            # Set X-limits to the current time window
-            self.ax_level.set_xlim(x_data[0], x_data[-1])
-            self.ax_flow.set_xlim(x_data[0], x_data[-1])
-            self.ax_cost.set_xlim(x_data[0], x_data[-1])
-            
-            # Set Y-limits
-            self.ax_level.set_ylim(0, max(max(self.L1_history) * 1.05, 8.5))
-            
-            flow_max = max(max(self.F1_history), max(self.F2_history))
-            self.ax_flow.set_ylim(0, flow_max * 1.1)
-
-            cost_max = max(self.cost_history) if self.cost_history else 0
-            self.ax_cost.set_ylim(0, cost_max * 1.1)
-            
-            price_max = max(self.price_history) if self.price_history else 0
-            self.ax_cost_twin.set_ylim(0, price_max * 1.2)
-        
-        # If the plot only has one point, ensure a reasonable scale
-        elif len(x_data) == 1:
-            self.ax_level.set_xlim(x_data[0] - 1, x_data[0] + 1)
-            self.ax_flow.set_xlim(x_data[0] - 1, x_data[0] + 1)
-            self.ax_cost.set_xlim(x_data[0] - 1, x_data[0] + 1)
-
-
-        # Update title with timestamp
-        self.fig.suptitle(
-            f'HSY Blominmäki Wastewater Pumping Station - {state.timestamp.strftime("%Y-%m-%d %H:%M:%S")}',
-            fontsize=16, fontweight='bold'
-        )
+        set_level, set_F1, set_F2, set_cost, set_price = self._line_setters
+        set_level(x_data, L1_hist)
+        set_F1(x_data, F1_hist)
+        set_F2(x_data, F2_hist)
+        set_cost(x_data, cost_hist)
+        set_price(x_data, price_hist)
+
+        # Auto-scale axes only when the data leaves the current view or falls
+        # well inside it, so most frames keep the axes (and the cached blit
+        # background) unchanged
+        self._update_xlim(int(x_data[0]), current_step)
+        self._fit_ylim(self.ax_level, L1_max, 1.05, minimum=8.5)
+        self._fit_ylim(self.ax_flow, max(F1_max, F2_max), 1.1)
+        self._fit_ylim(self.ax_cost, cost_max, 1.1)
+        self._fit_ylim(self.ax_cost_twin, price_max, 1.2)
+
+        # Update timestamp (formatted only when it changes, so it always
+        # matches the values drawn in the same frame)
+        if state.timestamp != self._last_timestamp:
+            self._last_timestamp = state.timestamp
+            # Same text as strftime('%Y-%m-%d %H:%M:%S'), without a UTC offset
+            self._set_text(self.time_text, state.timestamp.replace(tzinfo=None).isoformat(
+                sep=' ', timespec='seconds'))
 
         # --- Return artists (must return all modified artists) ---
-        return [self.water_patch, self.water_line, self.level_text,
-                self.inflow_text, self.outflow_text, self.inflow_arrow,
-                self.level_line, self.F1_line, self.F2_line,
-                self.cost_line, self.price_line] + list(self.pump_patches.values())
+        return self.animated_artists()
+
+    def _set_text(self, text_artist, text: str):
+        """Set an annotation's text only when the string actually changed"""
+        if self._shown_text.get(text_artist) != text:
+            text_artist.set_text(text)
+            self._shown_text[text_artist] = text
+
+    def _update_xlim(self, first_step: int, last_step: int):
+        """Move the shared time window in XLIM_STEP sized jumps"""
+        left = first_step - first_step % self.XLIM_STEP
+        right = last_step - last_step % self.XLIM_STEP + self.XLIM_STEP
+        if (left, right) == self._xlim:
+            return
+
+        for ax in (self.ax_level, self.ax_flow, self.ax_cost):
+            ax.set_xlim(left, right)
+        self._xlim = (left, right)
+        self.layout_dirty = True
+
+    def _fit_ylim(self, ax, data_max: float, headroom: float, minimum: float = 0.0):
+        """
+        Move the upper y-limit of an axis once the window's data outgrows it,
+        or once it has fallen well below it (e.g. a spike left the window)
+        """
+        top = max(data_max * headroom, minimum)
+        old_top = self._ylim_top.get(ax)
+        if old_top is not None:
+            if data_max > old_top:
+                # Steadily rising series (the running cost) would otherwise
+                # trigger a full redraw every few frames for a barely larger axis
+                top = max(top, old_top * self.YLIM_MIN_GROWTH)
+            elif top >= old_top / self.YLIM_MIN_GROWTH ** 2:
+                # Close enough to the current limit: keep it (and the background)
+                return
+        if top > 0:
+            ax.set_ylim(0, top)
+            self._ylim_top[ax] = top
+            self.layout_dirty = True
+
+    def animated_artists(self) -> list:
+        """Artists redrawn on every blit, in drawing order"""
+        # Pump labels sit on top of dynamic artists, so they are redrawn too
+        artists = [self.water_patch, self.water_line, self.level_text,
+                   self.inflow_text, self.outflow_text, self.time_text,
+                   self.level_line, self.F1_line, self.F2_line,
+                   self.cost_line, self.price_line]
+        artists += [self.pump_collection] + list(self.pump_labels.values())
+        return sorted(artists, key=lambda artist: artist.get_zorder())
+
+    def _on_draw(self, event):
+        """Cache the static background after a full draw, then paint dynamic artists"""
+
+        # Exports (savefig to PDF/SVG, or PNG at another dpi) draw through a
+        # different canvas or renderer; they must not replace the cached
+        # background, but still need the animated artists painted in
+        canvas = event.canvas
+        if canvas is self.fig.canvas and canvas.supports_blit and not canvas.is_saving():
+            self._background = canvas.copy_from_bbox(self.fig.bbox)
+
+        for artist in self.animated_artists():
+            artist.draw(event.renderer)
+
+    def redraw(self):
+        """
+        Render the latest update to the canvas using blitting
+
+        The static scene is cached after a full draw and only the dynamic
+        artists are painted on top of it. A full draw happens on the first
+        call and whenever update() changed axis limits.
+        """
+
+        canvas = self.fig.canvas
+
+        if self._background is None:
+            # Exclude dynamic artists from full draws; _on_draw paints them
+            for artist in self.animated_artists():
+                artist.set_animated(True)
+            canvas.mpl_connect('draw_event', self._on_draw)
+            self.layout_dirty = True
+
+        if self.layout_dirty:
+            canvas.draw()
+            self.layout_dirty = False
+            return
+
+        artists = self.animated_artists()
+        canvas.restore_region(self._background)
+        for artist in artists:
+            artist.axes.draw_artist(artist)
+
+        # Every dynamic artist lies inside its axes, so only those areas are pushed
+        for ax in {artist.axes for artist in artists}:
+            canvas.blit(ax.bbox)
 
     def show(self):
         """Display the visualization"""
-        plt.tight_layout()
         plt.show()
 
 
@@ -364,7 +597,24 @@ class SimulationVisualizer:
         self.interval_ms = interval_ms
         self.viz = WastewaterVisualizer() # Now uses the fixed visualizer
         self.running = True
-        
+
+        # Animation timer state (see run)
+        self._timer = None
+        self._frame = 0
+        self._max_steps = None
+
+        # Physics runs on a worker thread that queues (index, state) pairs
+        # for the GUI timer to drain (see _producer)
+        self._queue = queue.Queue(maxsize=8)
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._error = None  # Exception that stopped the producer, if any
+        self._producer_thread = None
+
+        # Simulator index last drawn, and the artists it returned
+        self._last_sim_version = -1
+        self._last_artists = []
+
     def control_strategy(self, state: SystemState) -> list:
         """
         Define pump control strategy
@@ -377,80 +627,99 @@ class SimulationVisualizer:
             List of PumpCommand
         """
 
-        commands = []
-        L1 = state.L1
-        
-        # --- 1. Define the pumps we want to be ON and their frequency ---
-        pumps_to_turn_on = {}
-
-        if L1 > 6.0:
-            # High level - run 4 pumps
-            pumps_to_turn_on = {
-                '1.2': 50.0,
-                '1.4': 50.0,
-                '2.2': 50.0,
-                '2.3': 50.0,
-            }
-        elif L1 > 3.0:
-            # Medium level - run 2 pumps
-            pumps_to_turn_on = {
-                '2.2': 49.0,
-                '2.3': 49.0,
-            }
-        elif L1 > 1.0:
-            # Low level - run 2 pumps at lower frequency
-            pumps_to_turn_on = {
-                '2.2': 48.0,
-                '2.3': 48.0,
-            }
-        else:
-            # Very low - run 1 pump minimum
-            pumps_to_turn_on = {
-                '2.1': 47.5,
-            }
-
-        # --- 2. Generate commands for all 8 pumps (ON or OFF) ---
-        all_pump_ids = ['1.1', '1.2', '1.3', '1.4', '2.1', '2.2', '2.3', '2.4']
-        
-        for pump_id in all_pump_ids:
-            if pump_id in pumps_to_turn_on:
-                # Command ON
-                commands.append(
-                    PumpCommand(pump_id, start=True, frequency=pumps_to_turn_on[pump_id])
-                )
-            else:
-                # Command OFF
-                # This explicitly stops any pump not selected in the current strategy
-                commands.append(
-                    PumpCommand(pump_id, start=False) 
-                )
+        # Pick the level band, then emit its precomputed ON/OFF command for
+        # every pump (pumps not selected in the band are explicitly stopped)
+        band = bisect_left(CONTROL_THRESHOLDS, state.L1)
 
-        return commands
+        return list(CONTROL_COMMANDS[band])
 
-    def step(self, frame):
-        """Animation step function"""
+    def _producer(self):
+        """Worker thread: step the simulator and queue every new state"""
+        try:
+            self._produce()
+        except Exception as e:
+            # Hand the failure to the GUI thread, which reports it (see step)
+            self._error = e
+        finally:
+            self._done.set()
 
-        if not self.running:
-            return []
+    def _produce(self):
+        """Step the simulator until done, stopped, or max_steps is reached"""
+
+        steps = 0
+        n_data = len(self.simulator.historical_data)
 
-        # Get current state
-        state = self.simulator.get_state()
+        while not self._stop.is_set():
+            if self._max_steps is not None and steps >= self._max_steps:
+                break
 
-        # Determine control commands
-        pump_commands = self.control_strategy(state)
+            # Get current state
+            state = self.simulator.get_state()
 
-        # Step simulator
-        new_state = self.simulator.step(pump_commands)
+            # Determine control commands
+            pump_commands = self.control_strategy(state)
 
-        # Update visualization
-        artists = self.viz.update(new_state)
+            # Step simulator
+            new_state = self.simulator.step(pump_commands)
+            steps += 1
+
+            # Block while the GUI is behind, but keep checking for shutdown
+            item = (self.simulator.historical_index, new_state)
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+            # Check if simulation complete
+            if item[0] >= n_data - 1:
+                break
+
+    def step(self, frame):
+        """Animation step function: apply the next state queued by the producer"""
 
-        # Check if simulation complete
-        if self.simulator.historical_index >= len(self.simulator.historical_data) - 1:
-            print("\n✓ Simulation complete!")
+        # Paused or finished: the artists are as they were last frame
+        if not self.running:
+            return self._last_artists
+
+        # One timestep per tick keeps playback at interval_ms per timestep;
+        # the queue only lets the physics run ahead of the GUI
+        try:
+            v, new_state = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            # The producer queues one state per simulator step, so every item
+            # is new; an empty queue is what skips the update and redraw
+            self._last_artists = self.viz.update(new_state)
+            self._last_sim_version = v
+
+        # Check if simulation complete (or failed)
+        if self._done.is_set() and self._queue.empty():
+            if self._error is not None:
+                print(f"\n❌ Simulation error: {self._error}")
+                traceback.print_exception(self._error)
+            else:
+                print("\n✓ Simulation complete!")
             self.running = False
 
-        return artists
+        return self._last_artists
+
+    def _on_timer(self):
+        """Timer callback: apply the next queued state and redraw the changed artists"""
+
+        if not self.running:
+            self._timer.stop()
+            return
+
+        version = self._last_sim_version
+        self.step(self._frame)
+        self._frame += 1
+
+        # Nothing changed since the last frame, so there is nothing to blit
+        if self._last_sim_version != version:
+            self.viz.redraw()
 
     def run(self, max_steps: Optional[int] = None):
         """
@@ -463,19 +732,27 @@ class SimulationVisualizer:
         print("Starting simulation visualization...")
         print("Close the window to stop.")
 
-        # Create animation
-        # Note: blit=False is safer when updating complex elements like axes and text.
-        anim = FuncAnimation(
-            self.viz.fig,
-            self.step,
-            interval=self.interval_ms,
-            blit=False,
-            repeat=False,
-            frames=max_steps
-        )
+        # The physics runs on a worker thread; the canvas timer takes one of
+        # its states per tick and blits only the dynamic artists (see
+        # _on_timer). Only the producer leaves the main thread, since GUI
+        # backends must stay on it
+        self._frame = 0
+        self._max_steps = max_steps
+        self._stop.clear()
+        self._done.clear()
+        self._error = None
+        self._producer_thread = threading.Thread(target=self._producer, daemon=True)
+        self._producer_thread.start()
+
+        self._timer = self.viz.fig.canvas.new_timer(interval=self.interval_ms)
+        self._timer.add_callback(self._on_timer)
+        self._timer.start()
 
         # Show
         plt.show()
+        self._timer.stop()
+        self._stop.set()
+        self._producer_thread.join()
 
         # Print final stats
         final_state = self.simulator.get_state()
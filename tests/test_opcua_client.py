@@ -5,39 +5,299 @@ Connects to the simulation server and tests reading/writing
 
 import asyncio
 import sys
-from pathlib import Path
+import traceback
+from contextlib import asynccontextmanager, suppress
+from types import SimpleNamespace
 
-# Add src to path
-sys.path.insert(0, str(Path(__file__).parent.parent / 'src' / 'simulation'))
-
-from asyncua import Client
+from asyncua import Client, ua
 import logging
 
+# Optional: faster event loop
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+NAMESPACE_URI = "http://hsy.fi/wastewater/blominmaki"
+TEST_TIMEOUT = 15  # Seconds a single test may take before it is abandoned
+SESSION_TIMEOUT_MS = 600000  # The longest session the server grants
+
+# One monitor output line (printf-style, applied once per tick)
+MONITOR_LINE = ("[%s] L1=%.2fm, F1=%.0fm³/15min, F2=%.0fm³/h, "
+                "Price=%.3fEUR/kWh, Cost=%.2fEUR\n")
+
+# Station browse names used by the tests (attribute -> name in the station namespace)
+STATION_NAMES = {
+    'station': "BlominmakiStation",
+    'sensors': "Sensors",
+    'status': "Status",
+    'control': "Control",
+    'pumps': "Pumps",
+    'pump_2_2': "Pump_2_2",
+    'start': "Start",
+    'set_frequency': "SetFrequency",
+    'flow': "Flow",
+    'power': "Power",
+    'efficiency': "Efficiency",
+    'water_level': "WaterLevel_L1",
+    'inflow': "Inflow_F1",
+    'outflow': "Outflow_F2",
+    'price': "ElectricityPrice",
+    'total_cost': "TotalEnergyCost",
+    'sim_time': "SimulationTime",
+}
+
+# Shared sessions by server URL (see TestClient.session), used by every
+# TestClient in the process
+_sessions = {}
+
+
+class SubHandler:
+    """Subscription handler that keeps the latest value of each node"""
+
+    def __init__(self):
+        self.values = {}
+        self.changed = {}  # Node -> Event set on its next change
+
+    def expect_change(self, nodes):
+        """Events set on the next change of each node (after its initial value)"""
+        return [self.changed.setdefault(node, asyncio.Event()) for node in nodes]
+
+    def datachange_notification(self, node, val, data):
+        """Called by asyncua whenever a subscribed value changes"""
+        # The first notification is the initial value; any later one is a change
+        if node in self.values and node in self.changed:
+            self.changed.pop(node).set()
+        self.values[node] = val
+
 
 class TestClient:
     """Simple OPC UA client for testing"""
 
     def __init__(self, url="opc.tcp://localhost:4840/hsy/wastewater/"):
-        self.client = Client(url=url)
+        self.url = url
+        self.client = None  # Client of the shared session, set by session()
         self.logger = logging.getLogger(__name__)
 
+        # Browse results are reused across tests (see _resolve)
+        self._nsidx = None
+        self._qn = None
+        self._node_cache = {}  # Tuple of browse names from the root -> Node
+        self._shared = None  # Entry of _sessions in use
+        self._session_cm = None  # Active session() while used in `async with`
+
     async def connect(self):
         """Connect to OPC UA server"""
-        await self.client.connect()
-        self.logger.info(f"✓ Connected to {self.client.server_url}")
 
-    async def disconnect(self):
-        """Disconnect from server"""
-        await self.client.disconnect()
-        self.logger.info("✓ Disconnected")
+        # Ask for long-lived channel and session so an idle session between
+        # test runs is kept alive by the client watchdog rather than expiring
+        self.client.secure_channel_timeout = SESSION_TIMEOUT_MS
+        self.client.session_timeout = SESSION_TIMEOUT_MS
+
+        await self.client.connect()
+        self.logger.info("✓ Connected to %s", self.client.server_url)
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Connected session, reused by later TestClients for the same URL
+
+        The session is registered before it connects, so a TestClient entered
+        meanwhile waits for that connection instead of opening its own. An
+        asyncua Client is bound to its event loop, so reuse only happens for
+        callers that drive several TestClients in one loop; main() runs once
+        and closes every session on exit.
+        """
+
+        shared = _sessions.get(self.url)
+        opened = shared is None
+        if opened:
+            self.client = Client(url=self.url)
+            shared = _sessions[self.url] = SimpleNamespace(
+                client=self.client,
+                connected=asyncio.ensure_future(self.connect()),
+                handler=SubHandler(),  # One subscription serves every test
+                subscription=None,     # (see _subscribe)
+                subscribed=set(),
+            )
+        else:
+            self.logger.info("✓ Reusing session to %s", self.url)
+            self.client = shared.client
+        self._shared = shared
+
+        # Fill the node cache up front so the tests do no browsing; if that
+        # fails on a new session, close it rather than leave it open on the
+        # server (shield: a TestClient that gives up waiting must not cancel
+        # the connection for the others)
+        try:
+            await asyncio.shield(shared.connected)
+            if not self._node_cache:
+                await self._prefetch_tree()
+        except BaseException:
+            if opened:
+                await self._drop_session()
+            raise
+
+        try:
+            yield self
+        except Exception as e:
+            # Failures inside a TaskGroup arrive wrapped in an ExceptionGroup
+            if isinstance(e, ExceptionGroup):
+                broken = e.subgroup((ConnectionError, TimeoutError)) is not None
+            else:
+                broken = isinstance(e, (ConnectionError, TimeoutError))
+
+            # Don't hand a broken session to the next run
+            if broken:
+                await self._drop_session()
+            raise
+        # The session stays open on success; close_sessions() ends it
+
+    async def _drop_session(self):
+        """Unregister the shared session and close it if the server is still there"""
+        shared = self._shared
+        if _sessions.get(self.url) is not shared:
+            return
+        del _sessions[self.url]
+        connected = shared.connected
+        if not connected.done():
+            connected.cancel()
+        elif not connected.cancelled() and connected.exception() is None:
+            with suppress(Exception):
+                await shared.client.disconnect()
+
+    async def __aenter__(self):
+        """Enter session() so the client can be used in `async with`"""
+        self._session_cm = self.session()
+        return await self._session_cm.__aenter__()
+
+    async def __aexit__(self, *exc_info):
+        return await self._session_cm.__aexit__(*exc_info)
+
+    async def _subscribe(self, nodes) -> SubHandler:
+        """
+        Subscribe to data changes of the nodes, on the session's one subscription
+
+        The subscription is never deleted on its own: a deleted subscription
+        can still get a publish response that was already on its way, and
+        closing the session stops publishing before it drops the subscription.
+        """
+        shared = self._shared
+        if shared.subscription is None:
+            shared.subscription = await self.client.create_subscription(100, shared.handler)
+        new_nodes = [node for node in nodes if node not in shared.subscribed]
+        if new_nodes:
+            await shared.subscription.subscribe_data_change(new_nodes)
+            shared.subscribed.update(new_nodes)
+        return shared.handler
+
+    async def _namespace_index(self) -> int:
+        """Namespace index of the station, looked up once"""
+        if self._nsidx is None:
+            self._nsidx = await self.client.get_namespace_index(NAMESPACE_URI)
+        return self._nsidx
+
+    async def _browse_names(self) -> SimpleNamespace:
+        """Qualified browse names ("ns:Name") of the station, formatted once"""
+        if self._qn is None:
+            nsidx = await self._namespace_index()
+            self._qn = SimpleNamespace(
+                objects="0:Objects",
+                **{attr: f"{nsidx}:{name}" for attr, name in STATION_NAMES.items()})
+        return self._qn
+
+    @staticmethod
+    def _browse_path(path) -> ua.BrowsePath:
+        """BrowsePath from the root node through the given browse names"""
+        bpath = ua.BrowsePath()
+        bpath.StartingNode = ua.NodeId(ua.ObjectIds.RootFolder)
+        for name in path:
+            element = ua.RelativePathElement()
+            element.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+            element.IsInverse = False
+            element.IncludeSubtypes = True
+            element.TargetName = ua.QualifiedName.from_string(name)
+            bpath.RelativePath.Elements.append(element)
+        return bpath
+
+    async def _prefetch_tree(self, depth=3):
+        """Browse the station subtree into the node cache, one request per level"""
+
+        qn = await self._browse_names()
+        station = (qn.objects, qn.station)
+        level = {station: await self._resolve(*station)}
+
+        for _ in range(depth):
+            params = ua.BrowseParameters()
+            for node in level.values():
+                description = ua.BrowseDescription()
+                description.NodeId = node.nodeid
+                description.BrowseDirection = ua.BrowseDirection.Forward
+                description.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+                description.IncludeSubtypes = True
+                description.ResultMask = ua.BrowseResultMask.BrowseName
+                params.NodesToBrowse.append(description)
+
+            results = await self.client.uaclient.browse(params)
+
+            # A server may cap the references returned per node; the rest are
+            # fetched with BrowseNext, one request for every pending node
+            children = {}
+            pending = list(zip(level, results))
+            while pending:
+                continued = []
+                for path, result in pending:
+                    result.StatusCode.check()
+                    for ref in result.References:
+                        child = (*path, ref.BrowseName.to_string())
+                        children[child] = self._node_cache[child] = self.client.get_node(ref.NodeId)
+                    if result.ContinuationPoint:
+                        continued.append((path, result.ContinuationPoint))
+
+                if not continued:
+                    break
+                next_params = ua.BrowseNextParameters()
+                next_params.ContinuationPoints = [point for _, point in continued]
+                results = await self.client.uaclient.browse_next(next_params)
+                pending = [(path, result) for (path, _), result in zip(continued, results)]
+
+            if not children:
+                break
+            level = children
+
+    def _cached_children(self, *path):
+        """Cached child nodes of a browse path by browse name, in browse order"""
+        return {child[-1]: node for child, node in self._node_cache.items() if child[:-1] == path}
+
+    async def _resolve_many(self, *paths):
+        """Nodes at several browse paths from the root, cached per path"""
+
+        # The server resolves every uncached path in one TranslateBrowsePaths
+        # request, however deep the paths are
+        missing = [path for path in dict.fromkeys(paths) if path not in self._node_cache]
+        if missing:
+            results = await self.client.uaclient.translate_browsepaths_to_nodeids(
+                [self._browse_path(path) for path in missing])
+            for path, result in zip(missing, results):
+                result.StatusCode.check()
+                self._node_cache[path] = self.client.get_node(result.Targets[0].TargetId)
+
+        return [self._node_cache[path] for path in paths]
+
+    async def _resolve(self, *path):
+        """Node at a browse path from the root"""
+        node, = await self._resolve_many(path)
+        return node
 
     async def test_read_sensors(self):
         """Test reading sensor values"""
 
         self.logger.info("\n=== Testing Sensor Reads ===")
 
-        # Get namespace index
-        nsidx = await self.client.get_namespace_index("http://hsy.fi/wastewater/blominmaki")
+        # Get namespace index and browse names
+        nsidx = await self._namespace_index()
+        qn = await self._browse_names()
 
         # Read sensor values
         sensors = {
@@ -45,77 +305,75 @@ class TestClient:
             'Water Volume': f'ns={nsidx};i=3',
         }
 
-        # Alternatively, browse the tree
-        root = self.client.get_root_node()
-        objects = await root.get_child(["0:Objects"])
-        station = await objects.get_child([f"{nsidx}:BlominmakiStation"])
-        sensors_folder = await station.get_child([f"{nsidx}:Sensors"])
+        # Alternatively, browse the tree (already prefetched on connect)
+        sensor_nodes = self._cached_children(qn.objects, qn.station, qn.sensors)
 
-        # Get all children
-        sensor_nodes = await sensors_folder.get_children()
+        # The browse names came with the prefetch, so a single Read request
+        # fetches every sensor value
+        values = await self.client.read_values(list(sensor_nodes.values()))
 
         print("\nAvailable sensors:")
-        for node in sensor_nodes:
-            name = await node.read_browse_name()
-            value = await node.read_value()
-            print(f"  {name.Name}: {value}")
+        for name, value in zip(sensor_nodes, values):
+            print(f"  {ua.QualifiedName.from_string(name).Name}: {value}")
 
     async def test_write_controls(self):
         """Test writing pump control commands"""
 
         self.logger.info("\n=== Testing Control Writes ===")
 
-        # Get namespace index
-        nsidx = await self.client.get_namespace_index("http://hsy.fi/wastewater/blominmaki")
-
-        # Navigate to control nodes
-        root = self.client.get_root_node()
-        objects = await root.get_child(["0:Objects"])
-        station = await objects.get_child([f"{nsidx}:BlominmakiStation"])
-        control_folder = await station.get_child([f"{nsidx}:Control"])
-
-        # Get pump control folder
-        pump_control = await control_folder.get_child([f"{nsidx}:Pump_2_2"])
+        # Get browse names
+        qn = await self._browse_names()
+
+        # Resolve every node this test uses in a single request
+        station = (qn.objects, qn.station)
+        pump_control = (*station, qn.control, qn.pump_2_2)
+        pump_status = (*station, qn.pumps, qn.pump_2_2)
+        start_node, freq_node, flow_node, power_node, eff_node = await self._resolve_many(
+            (*pump_control, qn.start),
+            (*pump_control, qn.set_frequency),
+            (*pump_status, qn.flow),
+            (*pump_status, qn.power),
+            (*pump_status, qn.efficiency),
+        )
+
+        # Watch the pump status before writing so its changes are pushed to us
+        status_nodes = [flow_node, power_node, eff_node]
+        handler = await self._subscribe(status_nodes)
+        changed = handler.expect_change(status_nodes)
 
         # Read current values
-        start_node = await pump_control.get_child([f"{nsidx}:Start"])
-        freq_node = await pump_control.get_child([f"{nsidx}:SetFrequency"])
-
-        current_start = await start_node.read_value()
-        current_freq = await freq_node.read_value()
+        current_start, current_freq = await self.client.read_values([start_node, freq_node])
 
         print(f"\nPump 2.2 current state:")
         print(f"  Start: {current_start}")
         print(f"  Frequency: {current_freq} Hz")
 
-        # Write new values
+        # Write new values (both in one Write request)
+        new_start, new_freq = True, 48.5
         print("\nWriting new values...")
-        await start_node.write_value(True)
-        await freq_node.write_value(48.5)
+        await self.client.write_values(
+            [start_node, freq_node],
+            [ua.Variant(new_start, ua.VariantType.Boolean),
+             ua.Variant(new_freq, ua.VariantType.Double)])
 
-        # Read back
-        new_start = await start_node.read_value()
-        new_freq = await freq_node.read_value()
+        # write_values raises on any bad StatusCode, so getting here means the
+        # server holds exactly these values; there is no need to read them back
 
         print(f"Pump 2.2 new state:")
         print(f"  Start: {new_start}")
         print(f"  Frequency: {new_freq} Hz")
 
-        # Wait a bit
-        print("\nWaiting 3 seconds for simulation to update...")
-        await asyncio.sleep(3)
+        # Wait until the simulation publishes new pump status, at most 3 seconds
+        # (nothing changes if the pump was already running at this frequency)
+        print("\nWaiting for simulation to update...")
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(event.wait() for event in changed)), 3.0)
+        except asyncio.TimeoutError:
+            print("  No change within 3 seconds")
 
         # Read pump status
-        pumps_folder = await station.get_child([f"{nsidx}:Pumps"])
-        pump_status = await pumps_folder.get_child([f"{nsidx}:Pump_2_2"])
-
-        flow_node = await pump_status.get_child([f"{nsidx}:Flow"])
-        power_node = await pump_status.get_child([f"{nsidx}:Power"])
-        eff_node = await pump_status.get_child([f"{nsidx}:Efficiency"])
-
-        flow = await flow_node.read_value()
-        power = await power_node.read_value()
-        eff = await eff_node.read_value()
+        flow, power, eff = await self.client.read_values(status_nodes)
 
         print(f"\nPump 2.2 performance:")
         print(f"  Flow: {flow:.0f} m³/h")
@@ -125,42 +383,63 @@ class TestClient:
     async def monitor_system(self, duration_seconds=30):
         """Monitor system for a period of time"""
 
-        self.logger.info(f"\n=== Monitoring System for {duration_seconds} seconds ===")
-
-        # Get namespace index
-        nsidx = await self.client.get_namespace_index("http://hsy.fi/wastewater/blominmaki")
-
-        # Navigate to nodes
-        root = self.client.get_root_node()
-        objects = await root.get_child(["0:Objects"])
-        station = await objects.get_child([f"{nsidx}:BlominmakiStation"])
-        sensors_folder = await station.get_child([f"{nsidx}:Sensors"])
-        status_folder = await station.get_child([f"{nsidx}:Status"])
-
-        # Get sensor nodes
-        L1_node = await sensors_folder.get_child([f"{nsidx}:WaterLevel_L1"])
-        F1_node = await sensors_folder.get_child([f"{nsidx}:Inflow_F1"])
-        F2_node = await sensors_folder.get_child([f"{nsidx}:Outflow_F2"])
-        price_node = await sensors_folder.get_child([f"{nsidx}:ElectricityPrice"])
-
-        # Get status nodes
-        cost_node = await status_folder.get_child([f"{nsidx}:TotalEnergyCost"])
-        time_node = await status_folder.get_child([f"{nsidx}:SimulationTime"])
-
-        # Monitor loop
-        start_time = asyncio.get_event_loop().time()
-        while (asyncio.get_event_loop().time() - start_time) < duration_seconds:
-            L1 = await L1_node.read_value()
-            F1 = await F1_node.read_value()
-            F2 = await F2_node.read_value()
-            price = await price_node.read_value()
-            cost = await cost_node.read_value()
-            sim_time = await time_node.read_value()
-
-            print(f"[{sim_time}] L1={L1:.2f}m, F1={F1:.0f}m³/15min, F2={F2:.0f}m³/h, "
-                  f"Price={price:.3f}EUR/kWh, Cost={cost:.2f}EUR")
-
-            await asyncio.sleep(2)
+        self.logger.info("\n=== Monitoring System for %s seconds ===", duration_seconds)
+
+        # Get browse names
+        qn = await self._browse_names()
+
+        # Get sensor and status nodes (one request for all six paths)
+        station = (qn.objects, qn.station)
+        sensors = (*station, qn.sensors)
+        status = (*station, qn.status)
+        L1_node, F1_node, F2_node, price_node, cost_node, time_node = await self._resolve_many(
+            (*sensors, qn.water_level),
+            (*sensors, qn.inflow),
+            (*sensors, qn.outflow),
+            (*sensors, qn.price),
+            (*status, qn.total_cost),
+            (*status, qn.sim_time),
+        )
+
+        # Subscribe instead of polling: the server pushes a notification
+        # only when one of these values changes
+        nodes = [L1_node, F1_node, F2_node, price_node, cost_node, time_node]
+        handler = await self._subscribe(nodes)
+
+        # Monitor loop (prints the latest pushed values, no reads)
+        now = asyncio.get_running_loop().time
+        # Each line goes to the binary stream as one pre-encoded write,
+        # after anything print() has buffered so far. A replaced stdout
+        # (StringIO, pytest capture, IDE consoles) may have no binary
+        # stream; it gets the text as is
+        sys.stdout.flush()
+        out = getattr(sys.stdout, 'buffer', None)
+        encoding = sys.stdout.encoding
+        if out is None:
+            out, encoding = sys.stdout, None
+
+        # Ticks land on fixed 2 s boundaries from the start, so time spent
+        # printing does not accumulate as drift
+        start_time = now()
+        next_tick = start_time
+        while now() - start_time < duration_seconds:
+            next_tick += 2
+            await asyncio.sleep(max(0, next_tick - now()))
+
+            if not all(node in handler.values for node in nodes):
+                continue
+            L1, F1, F2, price, cost, sim_time = (handler.values[node] for node in nodes)
+
+            text = MONITOR_LINE % (sim_time, L1, F1, F2, price, cost)
+            out.write(text.encode(encoding) if encoding else text)
+            out.flush()  # Keep the monitor live
+
+
+async def close_sessions():
+    """Disconnect every shared session"""
+    while _sessions:
+        _, shared = _sessions.popitem()
+        await shared.client.disconnect()
 
 
 async def main():
@@ -168,29 +447,28 @@ async def main():
 
     logging.basicConfig(level=logging.INFO)
 
-    client = TestClient()
-
     try:
-        # Connect
-        await client.connect()
+        # Connect (or reuse the session of an earlier run in this process)
+        async with TestClient() as client:
+            # One test at a time so the report reads in order; each is
+            # bounded in case the server hangs
+            await asyncio.wait_for(client.test_read_sensors(), TEST_TIMEOUT)
+            await asyncio.wait_for(client.test_write_controls(), TEST_TIMEOUT)
 
-        # Test reading sensors
-        await client.test_read_sensors()
+            # Monitor for a bit
+            await asyncio.wait_for(client.monitor_system(duration_seconds=30), 30 + TEST_TIMEOUT)
 
-        # Test writing controls
-        await client.test_write_controls()
-
-        # Monitor for a bit
-        await client.monitor_system(duration_seconds=30)
+    except (ConnectionError, TimeoutError) as e:
+        # Server not running or not answering: no traceback needed
+        print(f"\n❌ Could not reach OPC UA server: {e!r}")
 
     except Exception as e:
         print(f"\n❌ Error: {e}")
-        import traceback
         traceback.print_exc()
 
     finally:
         # Disconnect
-        await client.disconnect()
+        await close_sessions()
 
 
 if __name__ == "__main__":
@@ -201,4 +479,7 @@ if __name__ == "__main__":
     print("Start it with: python src/simulation/opcua_server.py")
     print()
 
+    if UVLOOP_AVAILABLE:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     asyncio.run(main())